@@ -10,14 +10,76 @@ Author: Junichiro Higuchi
 import re
 import sys
 import argparse
+import collections
+import concurrent.futures
+import functools
 import io
+import os
+import itertools
 from textwrap import dedent
 from pathlib import Path
 from datetime import date
-from typing import Generator, Any, TextIO, List, Iterable, Set
+from typing import Generator, Any, TextIO, List, Iterable, Set, NamedTuple, Sequence, Optional, Tuple, Deque
 
 # --- 定数 ---
 DEFAULT_ASK_FILE = "ap_words_asks.txt"
+# プロンプトファイルが使えない場合の依頼文
+DEFAULT_ASK_PROMPT = (
+    "以下の用語の解説を、基本的に400文字以内、複雑な場合は最大700文字で、表形式でまとめてください。\n"
+    "文体は簡潔にするために、「だ・である」系や体言止めでお願いします。"
+)
+WRITE_BUFFER_SIZE = 1 << 20  # 出力ファイル書き込み時のバッファサイズ (1MiB)
+SPLIT_WRITE_WORKERS = 8  # 分割出力時にファイルを並行して書き込むスレッド数
+
+# --- コンパイル済み正規表現 ---
+# 行ごとに呼ばれるため、モジュール読み込み時に一度だけコンパイルしておく
+# 前処理用 (テキスト全体を1回の走査で置換する。ドットリーダーだけが "..." に置き換わり、
+# 他の選択肢ではグループ1が空のため削除される)
+_PREPROCESS_RE = re.compile(
+    r"(\.{3})\.*"  # 長すぎるドットリーダー
+    r"|^Copyright\(c\) Information.*"  # Copyright行
+    r"|^-\d{1,3}-$"  # ページ番号行
+    r"|^[\s\u3000\ufeff\u200b]+",  # 行頭の空白や不可視文字 (空行もまとめて消える)
+    re.M
+)
+# 解析用
+_TOC_RE = re.compile(r'\s*\.{3,}\s*\d+$')  # 目次行
+# 行の種別ごとのパターン。上から順に優先され、1つの選言にまとめて1回のmatchで判定する
+# (str パターンの \d は全角数字にもマッチするため、大分類・中分類では全角数字用の選択肢は設けない。
+#  h1 は半角1桁または全角の複数桁という従来の条件をそのまま残している)
+_LINE_PATTERNS = (
+    ('cls', r'大分類(\d+)[:：](.+)\s+中分類(\d+)[:：](.+)'),  # 大分類・中分類
+    ('h3', r'^\s*(\d+)\.\s+(.*)'),  # 「1. 」形式の見出し
+    ('h1', r'^\s*[\(（](\d|[\uff10-\uff19]+)[\)）]\s*(.*)'),  # 「(1)」形式の見出し (半角数字は1桁のみ)
+    ('h2', r'^\s*([①-⑳])\s*(.*)'),  # 「①」形式の見出し
+    ('sub', r'^\s*[\(（]([a-z])[\)）]\s*(.*)'),  # 「(a)」形式の小項目
+    ('word', r'^\s*用語例(.*)'),  # 用語例の開始行
+)
+_LINE_RE = re.compile("|".join(f"(?P<{kind}>{pat})" for kind, pat in _LINE_PATTERNS))
+_LINE_GROUP = _LINE_RE.groupindex  # 種別名 -> 名前付きグループの番号
+# 上記パターンの先頭になりうる文字 (数字は str.isdecimal で判定)。前処理で行頭の空白は除去済み
+_CIRCLE_DIGITS = ''.join(chr(c) for c in range(0x2460, 0x2474))  # ①〜⑳
+_LINE_FIRST_CHARS = frozenset('大(（用' + _CIRCLE_DIGITS)
+_WORD_DELIM_RE = re.compile(r'[（()）、，]')  # 用語の区切りに関わる括弧と読点
+
+# --- 解析結果のデータブロック ---
+# ブロック種別 (Block.kind)
+BLOCK_HEADER = 0  # 見出し
+BLOCK_TEXT = 1  # 通常のテキスト
+BLOCK_WORDS = 2  # 用語例ブロック
+
+class Block(NamedTuple):
+    """parse_syllabus が生成するデータブロック。種別に関係のないフィールドは既定値のままです。"""
+    kind: int
+    text: str = ""  # 見出し・テキストの本文
+    level: int = 0  # 見出しレベル (1: 中分類 〜 4: ①形式)
+    full_title: str = ""  # 中分類見出しの完全なタイトル
+    h1: str = ""  # 用語例ブロックの文脈 (「1. 」形式の見出し)
+    h2: str = ""  # 用語例ブロックの文脈 (「(1)」形式の見出し)
+    words: Sequence[str] = ()  # 抽出された用語
+
+class SyllabusParseError(Exception):
+    """逐次出力中に、シラバスの解析側で発生した例外を出力側の例外と区別するためのラッパーです。"""
 
 # ----------------------------------------
 # ヘルパー関数
@@ -26,41 +88,44 @@ def clean_text(text: str) -> str:
     """テキストのインデントを削除し、前後の空白を取り除きます。"""
     return dedent(text).strip()
 
-def read_paragraphs(filename: str) -> list:
+@functools.lru_cache(maxsize=None)
+def read_paragraphs(filename: str) -> Tuple[str, ...]:
     """
-    テキストファイルを読み込み、空行で区切られた段落のリストを返します。
-    エラーの場合は空のリストを返します。
+    テキストファイルを読み込み、空行で区切られた段落のタプルを返します。
+    エラーの場合は空のタプルを返します。
+    結果はファイル名ごとにキャッシュされるため、変更されないようタプルで返します。
     """
     try:
         with open(filename, 'r', encoding='utf-8') as f:
             # 連続した空行を区切り文字として段落に分割
-            return [p.strip() for p in f.read().split('\n\n') if p.strip()]
+            return tuple(p.strip() for p in f.read().split('\n\n') if p.strip())
     except FileNotFoundError:
         print(f"エラー: ファイル '{filename}' が見つかりません。", file=sys.stderr)
-        return []
+        return ()
     except Exception as e:
         print(f"エラー: {type(e).__name__}:{e}", file=sys.stderr)
-        return []
+        return ()
 
 def get_ask_prompt(filename: str, para_id: list) -> str:
     """
     AIへのプロンプト文を構築します。
+    同じ引数での呼び出し結果はキャッシュされ、ファイルの再読み込みや再選択は行いません。
     
     Args:
         filename: プロンプト文が格納されたテキストファイル。
         para_id: プロンプト文に含める段落番号のリスト。
     """
-    ask_default = clean_text("""
-    以下の用語の解説を、基本的に400文字以内、複雑な場合は最大700文字で、表形式でまとめてください。
-    文体は簡潔にするために、「だ・である」系や体言止めでお願いします。
-    """)
+    return _get_ask_prompt_cached(filename, tuple(para_id))
 
+@functools.lru_cache(maxsize=None)
+def _get_ask_prompt_cached(filename: str, para_id: Tuple[int, ...]) -> str:
+    """get_ask_prompt の本体です。lru_cache のキーにするため para_id はタプルで受け取ります。"""
     if not filename:
-        return ask_default
+        return DEFAULT_ASK_PROMPT
     
     asks = read_paragraphs(filename)
     if not asks:
-        return ask_default
+        return DEFAULT_ASK_PROMPT
 
     # 段落番号が有効かチェック
     is_id_valid = all(0 < i <= len(asks) for i in para_id)
@@ -88,15 +153,15 @@ def get_ask_prompt(filename: str, para_id: list) -> str:
 
     selected_prompts = [asks[i-1] for i in para_id]
     # 複数のプロンプト文がある場合はパイプ記号で区切る
-    return "\n|\n".join(selected_prompts) if selected_prompts else ask_default
+    return "\n|\n".join(selected_prompts) if selected_prompts else DEFAULT_ASK_PROMPT
 
-def preprocess_line(text: str) -> str:
-    """シラバスPDFからコピーしたテキストの1行を前処理します。"""
-    text = re.sub(r"\.{3,}", "...", text)  # 長すぎるドットリーダーを短縮
-    text = re.sub(r"^Copyright\(c\) Information.*", "", text)  # Copyright行を削除
-    text = re.sub(r"^-\d{1,3}-$", "", text)  # ページ番号行を削除
-    text = re.sub(r'^[\s\u3000\ufeff\u200b]+', '', text)  # 行頭の空白や不可視文字を削除
-    return text.strip()
+def preprocess_text(text: str) -> str:
+    """
+    シラバスPDFからコピーしたテキスト全体を前処理します。
+    ドットリーダーの短縮、Copyright行・ページ番号行・行頭の空白の削除を、
+    ファイル全体に対する1回の置換で行います。
+    """
+    return _PREPROCESS_RE.sub(r"\1", text)
 
 # ----------------------------------------
 # 中核ロジック関数
@@ -105,198 +170,248 @@ def listup_wordlines(wordlines: List[str]) -> list:
     """
     複数行のテキストを結合し、括弧の外にある「、」または「，」で区切られた用語を抽出します。
     """
-    full_text = "".join(line for line in wordlines)
+    full_text = "".join(wordlines)
     yougo = []
-    current_word = ""
+    start = 0  # 現在の用語の開始位置
     in_parentheses = 0  # 括弧のネストレベル
 
-    for char in full_text:
+    # 括弧と読点だけを正規表現で拾い、それ以外の文字はPythonのループで見ない
+    for m in _WORD_DELIM_RE.finditer(full_text):
+        char = m.group()
         if char in '（(':
             in_parentheses += 1
         elif char in '）)':
             if in_parentheses > 0:
                 in_parentheses -= 1
-        
-        # 括弧の外にある読点（区切り文字）を検出
-        if in_parentheses == 0 and char in '、，':
-            if current_word.strip():
-                yougo.append(current_word.strip())
-            current_word = ""
-        else:
-            current_word += char
+        # 括弧の外にある読点（区切り文字）で用語を切り出す
+        elif in_parentheses == 0:
+            word = full_text[start:m.start()].strip()
+            if word:
+                # 同じ用語は複数の節に現れるため、intern して文字列を共有する
+                yougo.append(sys.intern(word))
+            start = m.end()
 
     # 最後の単語を追加
-    if current_word.strip():
-        yougo.append(current_word.strip())
+    word = full_text[start:].strip()
+    if word:
+        yougo.append(sys.intern(word))
 
     return yougo
 
-def parse_syllabus(filename: str) -> Generator[dict, None, None]:
+def parse_syllabus(filename: str, words_only: bool = False) -> Generator[Block, None, None]:
     """
     シラバスファイルを解析し、構造化されたデータブロックをyieldするジェネレータです。
     この関数は解析のみに専念し、出力形式には関与しません。
+
+    Args:
+        filename: シラバスのテキストファイル。
+        words_only: True の場合は用語例ブロックのみをyieldします (辞書モード用)。
+            見出しや本文のブロックは生成せず、用語例ブロックの h1/h2 も空になります。
     """
     h1txt = ""
     h2txt = ""
     wordlines = []
     
     with open(filename, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = preprocess_line(line)
-            if not line: continue
-
-            # ▼▼▼ 変更点: 目次行の判定ロジックを追加 ▼▼▼
-            # 行末が「...」と数字で終わる場合は目次行とみなし、通常のテキストとして処理する
-            if re.search(r'\s*\.{3,}\s*\d+$', line):
-                yield {'type': 'text', 'text': line}
-                continue
-            # ▲▲▲ 変更点 ▲▲▲
-
-            # --- 各階層の見出しに対応する正規表現 ---
-            m_class_match = re.match(r'大分類(\d+|[\uff10-\uff19]+)[:：](.+)\s+中分類(\d+|[\uff10-\uff19]+)[:：](.+)', line)
-            m3_match = re.match(r'^\s*(\d+)\.\s+(.*)', line)
-            m1_match = re.match(r'^\s*[\(（](\d|[\uff10-\uff19]+)[\)）]\s*(.*)', line)
-            m2_match = re.match(r'^\s*([①-⑳])\s*(.*)', line)
-            m_sub_match = re.match(r'^\s*[\(（]([a-z])[\)）]\s*(.*)', line)
-            m_word_start = re.match(r'^\s*用語例(.*)', line)
-            
-            # --- 現在の「用語例」ブロックを終了させるためのロジック ---
-            is_header_or_class = m_class_match or m3_match or m1_match or m2_match or m_sub_match
-            if wordlines and (is_header_or_class or m_word_start):
-                yield {'type': 'word_block', 'h1': h1txt, 'h2': h2txt, 'words': listup_wordlines(wordlines)}
-                wordlines = []
-            
-            # --- マッチしたパターンに基づいて現在の行を処理 ---
-            if m_class_match:
-                h1txt, h2txt = "", "" # 文脈をリセット
-                full_title = f"大分類{m_class_match.group(1)}：{m_class_match.group(2).strip()} 中分類{m_class_match.group(3)}：{m_class_match.group(4).strip()}"
-                link_text = f"中分類{m_class_match.group(3)}：{m_class_match.group(4).strip()}"
-                yield {'type': 'header', 'level': 1, 'text': link_text, 'full_title': full_title}
-            elif m3_match:
-                h1txt = m3_match.group(2).strip()
-                h2txt = ""
-                yield {'type': 'header', 'level': 2, 'text': f"{m3_match.group(1)}. {h1txt}"}
-            elif m1_match:
-                h2txt = m1_match.group(2).strip() # このレベルではh2txtを使用
-                yield {'type': 'header', 'level': 3, 'text': f"({m1_match.group(1)}) {h2txt}"}
-            elif m2_match:
-                # このレベルではプロンプト用のh1/h2文脈を更新しない
-                yield {'type': 'header', 'level': 4, 'text': f"{m2_match.group(1)} {m2_match.group(2).strip()}"}
-            elif m_sub_match:
-                yield {'type': 'text', 'text': line}
-            elif m_word_start:
-                wordlines.append(m_word_start.group(1).strip())
-            elif wordlines:
+        text = preprocess_text(f.read())
+
+    # ファイル読み込み時と同様に \n のみで行に分割する
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line: continue
+
+        # ▼▼▼ 変更点: 目次行の判定ロジックを追加 ▼▼▼
+        # 行末が「...」と数字で終わる場合は目次行とみなし、通常のテキストとして処理する
+        # (大半の行は安価な文字列チェックで除外し、正規表現は候補行にのみ適用する)
+        if '...' in line and line[-1:].isdigit() and _TOC_RE.search(line):
+            if not words_only:
+                yield Block(BLOCK_TEXT, text=line)
+            continue
+        # ▲▲▲ 変更点 ▲▲▲
+
+        # --- 各階層の見出しを1回のmatchで判定 ---
+        # 先頭文字が見出しになりえない本文行は正規表現を使わずに済ませる
+        first = line[0]
+        m = _LINE_RE.match(line) if first in _LINE_FIRST_CHARS or first.isdecimal() else None
+        kind = m.lastgroup if m else None
+        # 判定された種別のサブグループだけを取り出す (g[0] が第1グループ)
+        g = m.groups()[_LINE_GROUP[kind]:] if m else ()
+        
+        # --- 現在の「用語例」ブロックを終了させるためのロジック ---
+        # 見出し・小項目・新たな用語例のいずれかに該当すればブロックを閉じる
+        if wordlines and kind:
+            yield Block(BLOCK_WORDS, h1=h1txt, h2=h2txt, words=listup_wordlines(wordlines))
+            wordlines.clear()  # 用語は抽出済みなので、リストは作り直さずに再利用する
+        
+        if words_only:
+            # 見出しの文脈や本文は不要なため、用語例の収集だけを行う
+            if kind == 'word':
+                wordlines.append(g[0].strip())
+            elif wordlines and not kind:
                 wordlines.append(line)
-            else:
-                yield {'type': 'text', 'text': line}
+            continue
         
-        # ファイル末尾に残っている用語例ブロックを処理
-        if wordlines:
-            yield {'type': 'word_block', 'h1': h1txt, 'h2': h2txt, 'words': listup_wordlines(wordlines)}
+        # --- マッチしたパターンに基づいて現在の行を処理 ---
+        if kind == 'cls':
+            h1txt, h2txt = "", "" # 文脈をリセット
+            full_title = f"大分類{g[0]}：{g[1].strip()} 中分類{g[2]}：{g[3].strip()}"
+            link_text = f"中分類{g[2]}：{g[3].strip()}"
+            yield Block(BLOCK_HEADER, text=link_text, level=1, full_title=full_title)
+        elif kind == 'h3':
+            h1txt = g[1].strip()
+            h2txt = ""
+            yield Block(BLOCK_HEADER, text=f"{g[0]}. {h1txt}", level=2)
+        elif kind == 'h1':
+            h2txt = g[1].strip() # このレベルではh2txtを使用
+            yield Block(BLOCK_HEADER, text=f"({g[0]}) {h2txt}", level=3)
+        elif kind == 'h2':
+            # このレベルではプロンプト用のh1/h2文脈を更新しない
+            yield Block(BLOCK_HEADER, text=f"{g[0]} {g[1].strip()}", level=4)
+        elif kind == 'sub':
+            yield Block(BLOCK_TEXT, text=line)
+        elif kind == 'word':
+            wordlines.append(g[0].strip())
+        elif wordlines:
+            wordlines.append(line)
+        else:
+            yield Block(BLOCK_TEXT, text=line)
+    
+    # ファイル末尾に残っている用語例ブロックを処理
+    if wordlines:
+        yield Block(BLOCK_WORDS, h1=h1txt, h2=h2txt, words=listup_wordlines(wordlines))
+
+def tag_parse_errors(blocks: Iterable[Block]) -> Generator[Block, None, None]:
+    """
+    解析結果をそのまま流し、解析中に発生した例外を SyllabusParseError に包んで送出します。
+    出力処理が解析と並行して進む場合でも、書き込みエラーと区別できるようにします。
+    """
+    try:
+        yield from blocks
+    except Exception as e:
+        raise SyllabusParseError(e) from e
 
 # ----------------------------------------
 # 出力整形関数
 
-def format_prompt(h1txt: str, h2txt: str, words: List[str], ask_txt: str, out: TextIO):
+def format_prompt(h1txt: str, h2txt: str, words: Sequence[str], ask_txt: str, out: TextIO):
     """AIへのプロンプトテキストを整形して出力します。"""
-    midashi_text = ""
-    if h1txt and h2txt:
-        midashi_text = f"「{h1txt}」における「{h2txt}」"
-    elif h1txt:
-        midashi_text = f"「{h1txt}」"
+    # h1txt がない場合は見出しを付けない (h2txt だけでは使わない)
+    midashi_text = (f"「{h1txt}」における「{h2txt}」" if h2txt else f"「{h1txt}」") if h1txt else ""
     
-    print(f"\n_ask\n応用情報技術者試験のシラバスの{midashi_text}について、\n{ask_txt}", file=out)
-    for word in words:
-        print(word, file=out)
-    print(file=out)
+    # 1ブロック分をまとめて書き込む
+    parts = ["\n_ask\n応用情報技術者試験のシラバスの", midashi_text, "について、\n", ask_txt, "\n"]
+    parts.extend(f"{word}\n" for word in words)
+    parts.append("\n")
+    out.writelines(parts)
 
-def output_results(structured_data: Iterable[dict], ask_txt: str, out: TextIO, use_md: bool, mode: str, level_offset: int = 0):
+def output_results(structured_data: Iterable[Block], ask_txt: str, out: TextIO, use_md: bool, mode: str, level_offset: int = 0):
     """
     解析済みのデータを受け取り、モードとレベルオフセットに基づいて出力用に整形します。
     """
+    # モードは途中で変わらないため、何を出力するかはループの前に一度だけ決めておく
+    show_body = mode == "normal"  # 見出し・本文・用語例の一覧を出力するか
+    show_prompt = mode in ("normal", "ask")  # 用語解説依頼のプロンプトを出力するか
+
     for block in structured_data:
-        b_type = block.get('type')
-
-        if b_type == 'header':
-            if mode == "normal":
-                level = block.get('level', 1)
-                # レベルがオフセット後も1以上の場合のみ出力
-                if level - level_offset > 0:
-                    text = block.get('text', '').strip()
-                    prefix = "#" * (level - level_offset) + " " if use_md else ""
-                    print(f"\n{prefix}{text}", file=out)
-
-        elif b_type == 'text':
-            if mode == "normal":
-                print(block.get('text', '').strip(), file=out)
-
-        elif b_type == 'word_block':
-            words = block.get('words', [])
+        kind = block.kind
+
+        if kind == BLOCK_WORDS:
+            words = block.words
             if not words: continue
 
-            if mode == "ask":
-                format_prompt(block['h1'], block['h2'], words, ask_txt, out)
-            elif mode == "normal":
-                print(f"\n用語例: {', '.join(words)}", file=out)
-                format_prompt(block['h1'], block['h2'], words, ask_txt, out)
+            if show_body:
+                out.write(f"\n用語例: {', '.join(words)}\n")
+            if show_prompt:
+                format_prompt(block.h1, block.h2, words, ask_txt, out)
+
+        elif not show_body:
+            continue
+
+        elif kind == BLOCK_HEADER:
+            level = block.level
+            # レベルがオフセット後も1以上の場合のみ出力
+            if level - level_offset > 0:
+                text = block.text.strip()
+                prefix = "#" * (level - level_offset) + " " if use_md else ""
+                out.write(f"\n{prefix}{text}\n")
 
-def handle_split_output(args: argparse.Namespace, ask_txt: str, structured_data: List[dict]):
-    """分割出力モードの処理を行います。"""
+        elif kind == BLOCK_TEXT:
+            out.write(f"{block.text.strip()}\n")
+
+def handle_split_output(args: argparse.Namespace, ask_txt: str, structured_data: Iterable[Block]):
+    """
+    分割出力モードの処理を行います。
+    データを1回走査するだけで、中分類が1つ揃うごとにそのファイルの書き込みを開始します。
+    書き込み待ちの中分類は SPLIT_WRITE_WORKERS 個までに抑えます。
+    """
     base_path = Path(args.output_file)
     base_name = base_path.stem
     ext = base_path.suffix
+    today = date.today().isoformat()
+
+    def write_chunk(i: int, chunk: List[Block]):
+        split_filename = base_path.parent / f"{base_name}{i:02d}{ext}"
+        full_title = chunk[0].full_title or '無題'
+        body = io.StringIO()
+        # YAMLフロントマターと、本文の先頭に太字のタイトルを出力
+        body.write(
+            "---\n"
+            f"title: {full_title}\n"
+            f"date: {today}\n"
+            "tags: [応用情報技術者試験, シラバス, 用語集]\n"
+            "---\n\n"
+            f"**{full_title}**\n\n"
+        )
+        # 最初のヘッダーを除いた内容を、レベルを1下げて出力
+        output_results(chunk[1:], ask_txt, body, True, "normal", level_offset=1)
+        split_filename.write_text(body.getvalue(), encoding='utf-8')
 
-    chunks = []
     pre_content = []
-    current_chunk = []
-    
-    # データを中分類（レベル1ヘッダー）ごとに分割
-    first_header_found = False
-    for block in structured_data:
-        if block.get('type') == 'header' and block.get('level') == 1:
-            first_header_found = True
-            if current_chunk:
-                chunks.append(current_chunk)
-            current_chunk = [block]
-        elif first_header_found:
-            current_chunk.append(block)
-        else:
-            pre_content.append(block)
-    if current_chunk:
-        chunks.append(current_chunk)
-
-    # 1. 目次ファイルの作成
-    with open(base_path, 'w', encoding='utf-8') as f:
-        print("目次\n---", file=f)
-        for i, chunk in enumerate(chunks, 1):
-            chunk_title = chunk[0].get('text', f'無題{i}')
+    chunk_titles = []  # 目次に載せる各分割ファイルのタイトル
+    current_chunk: List[Block] = []
+    pending: Deque[concurrent.futures.Future] = collections.deque()  # 書き込み中・待ちの中分類
+
+    # 1. 各分割ファイルの作成
+    # データを中分類（レベル1ヘッダー）ごとに区切り、区切りが確定したものから
+    # 別スレッドで書き込む (各ファイルは互いに独立している)。
+    # 解析の方が書き込みより速いため、待ちが上限に達したら最も古い書き込みの完了を待ち、
+    # 保持する中分類の数を抑える (シラバス本文自体は parse_syllabus が一括で読み込んでいる)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SPLIT_WRITE_WORKERS) as executor:
+
+        def submit_chunk(i: int, chunk: List[Block]):
+            if len(pending) >= SPLIT_WRITE_WORKERS:
+                # 書き込み時の例外はここで呼び出し元に伝わる
+                pending.popleft().result()
+            pending.append(executor.submit(write_chunk, i, chunk))
+
+        for block in structured_data:
+            if block.kind == BLOCK_HEADER and block.level == 1:
+                if current_chunk:
+                    submit_chunk(len(chunk_titles), current_chunk)
+                current_chunk = [block]
+                chunk_titles.append(block.text or f'無題{len(chunk_titles) + 1}')
+            elif current_chunk:
+                current_chunk.append(block)
+            else:
+                pre_content.append(block)
+        if current_chunk:
+            submit_chunk(len(chunk_titles), current_chunk)
+        # 残りの書き込み時の例外を呼び出し元に伝える
+        for future in pending:
+            future.result()
+
+    # 2. 目次ファイルの作成
+    with open(base_path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+        toc = ["目次\n---\n"]
+        for i, chunk_title in enumerate(chunk_titles, 1):
             split_filename = f"{base_name}{i:02d}{ext}"
-            print(f"- [{chunk_title}]({split_filename})", file=f)
-        
-        print("\n---", file=f)
+            toc.append(f"- [{chunk_title}]({split_filename})\n")
+        toc.append("\n---\n")
+        f.writelines(toc)
         # 序文を出力
         output_results(pre_content, ask_txt, f, True, "normal")
 
-    # 2. 各分割ファイルの作成
-    for i, chunk in enumerate(chunks, 1):
-        split_filename = base_path.parent / f"{base_name}{i:02d}{ext}"
-        full_title = chunk[0].get('full_title', '無題')
-        with open(split_filename, 'w', encoding='utf-8') as f:
-            # YAMLフロントマターの出力
-            print("---", file=f)
-            print(f"title: {full_title}", file=f)
-            print(f"date: {date.today().isoformat()}", file=f)
-            print("tags: [応用情報技術者試験, シラバス, 用語集]", file=f)
-            print("---\n", file=f)
-            
-            # 本文の先頭にタイトルを太字で出力
-            print(f"**{full_title}**\n", file=f)
-
-            # 最初のヘッダーを除いた内容を、レベルを1下げて出力
-            output_results(chunk[1:], ask_txt, f, True, "normal", level_offset=1)
-
-def handle_output(args: argparse.Namespace, ask_txt: str, structured_data: List[dict], master_dictionary: Set[str]):
+def handle_output(args: argparse.Namespace, ask_txt: str, structured_data: Iterable[Block], master_dictionary: Set[str]):
     """
     引数に基づいて、単一出力または分割出力を実行します。
     """
@@ -308,7 +423,13 @@ def handle_output(args: argparse.Namespace, ask_txt: str, structured_data: List[
             print("エラー: 分割出力モードはMarkdown形式(.md, .markdown)でのみサポートされています。", file=sys.stderr)
             sys.exit(1)
         
-        handle_split_output(args, ask_txt, structured_data)
+        try:
+            handle_split_output(args, ask_txt, structured_data)
+        except SyllabusParseError:
+            raise
+        except Exception as e:
+            print(f"エラー: 分割ファイルの書き込みに失敗しました。詳細: {e}", file=sys.stderr)
+            sys.exit(1)
         print(f"分割ファイルが {Path(args.output_file).stem}XX.md の形式で生成されました。", file=sys.stderr)
 
     else: # 単一ファイル出力
@@ -317,19 +438,26 @@ def handle_output(args: argparse.Namespace, ask_txt: str, structured_data: List[
 
         def write_data(out_stream):
             if args.mode == "dict":
-                print("\n".join(sorted(list(master_dictionary))), file=out_stream)
+                out_stream.write("\n".join(sorted(master_dictionary)))
+                out_stream.write("\n")
             else:
                 output_results(structured_data, ask_txt, out_stream, use_md, args.mode)
 
         if output_target:
             try:
-                with open(output_target, 'w', encoding='utf-8') as f:
+                with open(output_target, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
                     write_data(f)
+            except SyllabusParseError:
+                # 途中まで書き込まれた出力ファイルは残さない
+                Path(output_target).unlink(missing_ok=True)
+                raise
             except Exception as e:
                 print(f"エラー: 出力ファイル '{output_target}' への書き込みに失敗しました。詳細: {e}", file=sys.stderr)
                 sys.exit(1)
         else:
+            # 書き込みエラー (BrokenPipeError など) はここで確定させ、呼び出し元に伝える
             write_data(sys.stdout)
+            sys.stdout.flush()
 
 # ----------------------------------------
 # メイン実行ブロック
@@ -359,7 +487,12 @@ def print_usage():
     """
     print(clean_text(msg))
 
-if __name__ == '__main__':
+def main(argv: Optional[List[str]] = None):
+    """
+    コマンドラインのエントリポイントです。argv を省略すると sys.argv から引数を読み取ります。
+    同一プロセスで複数回呼び出す場合は import して main([...]) を呼ぶと、
+    正規表現のコンパイルやプロンプトファイルの読み込みが一度で済みます。
+    """
     parser = argparse.ArgumentParser(
         description="IPAシラバスから用語を抽出し、プロンプト文を作成します。",
         formatter_class=argparse.RawTextHelpFormatter,
@@ -372,7 +505,7 @@ if __name__ == '__main__':
     parser.add_argument('-o', '--output', dest='output_file', help="出力ファイル名。")
     parser.add_argument('-s', '-S', '--split', action='store_true', help="出力を中分類ごとに分割します。")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if args.help:
         print_usage()
@@ -397,16 +530,23 @@ if __name__ == '__main__':
     ask_txt = get_ask_prompt(prompt_file, prompt_id)
     
     # --- ステップ2: シラバスの解析とデータ集約 ---
-    # ジェネレータはここで一度だけ消費し、全データ構造を構築する
+    # ブロック全体は保持せず、出力処理が解析結果を逐次受け取る
     try:
-        structured_data = []
+        structured_data: Iterable[Block] = []
         master_dictionary = set()
         
-        results_generator = parse_syllabus(args.filename_syllabus)
-        for block in results_generator:
-            structured_data.append(block)
-            if block.get('type') == 'word_block' and block.get('words'):
-                master_dictionary.update(block['words'])
+        dict_only = args.mode == "dict" and not args.split
+        results_generator = parse_syllabus(args.filename_syllabus, words_only=dict_only)
+        if dict_only:
+            # 用語リストだけが必要なので、ブロック自体は保持しない
+            for block in results_generator:
+                if block.kind == BLOCK_WORDS:
+                    master_dictionary.update(block.words)
+        else:
+            # 解析しながら逐次出力する。ファイルを開けるかは最初のブロックを取り出してここで確認する
+            first_block = next(results_generator, None)
+            if first_block is not None:
+                structured_data = tag_parse_errors(itertools.chain((first_block,), results_generator))
 
     except FileNotFoundError:
         # エラーメッセージは parse_syllabus 内で処理済み
@@ -416,6 +556,25 @@ if __name__ == '__main__':
         sys.exit(1)
         
     # --- ステップ3: 出力処理 ---
-    # 集約したデータをまとめて出力ハンドラに渡す
-    handle_output(args, ask_txt, structured_data, master_dictionary)
+    # 逐次出力の場合は残りの解析もここで進むため、解析側の例外だけをここで捕捉する
+    # (書き込みエラーは handle_output 内でそれぞれのメッセージを出す)
+    try:
+        handle_output(args, ask_txt, structured_data, master_dictionary)
+    except SyllabusParseError as e:
+        print(f"解析中にエラーが発生しました: {e}", file=sys.stderr)
+        sys.exit(1)
 
+if __name__ == '__main__':
+    # 以下の標準出力の扱いはプロセス全体に影響するため、コマンドラインから実行した場合に限る
+    # 端末への出力でも1行ごとにフラッシュせず、バッファにまとめてから書き出す
+    if isinstance(sys.stdout, io.TextIOWrapper) and sys.stdout.line_buffering:
+        sys.stdout.reconfigure(line_buffering=False)
+    try:
+        main()
+    except BrokenPipeError:
+        # 出力先のパイプが先に閉じられた場合 (例: | head) は、終了時のフラッシュで
+        # 再び例外が出ないよう標準出力を /dev/null に向けてから終了する
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+        sys.exit(1)